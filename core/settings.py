@@ -119,8 +119,14 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# File-based so every process on the host shares one cache: invalidations sent
+# by manage.py import_movies or another worker reach the web server too
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
     }
 }
+
+# Swaps in a private in-memory cache for the test suite
+TEST_RUNNER = 'core.test_runner.TestRunner'
@@ -0,0 +1,24 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Genre
+
+# Bump the version whenever the shape of the cached list changes
+GENRE_LIST_CACHE_KEY = 'genre:list:v1'
+GENRE_LIST_TIMEOUT = 60 * 60
+
+
+def cached_genre_list():
+    '''All genres ordered by name, shared through the cache until one changes'''
+    return cache.get_or_set(
+        GENRE_LIST_CACHE_KEY,
+        lambda: list(Genre.objects.only('name').order_by('name')),
+        GENRE_LIST_TIMEOUT,
+    )
+
+
+@receiver([post_save, post_delete], sender=Genre)
+def invalidate_genre_list(**kwargs):
+    '''Drop the cached genre list whenever a genre is added, changed or removed'''
+    cache.delete(GENRE_LIST_CACHE_KEY)
@@ -3,6 +3,7 @@ from django.urls import reverse
 from django.core.cache import cache
 
 from .models import Genre
+from .signals import GENRE_LIST_CACHE_KEY
 
 
 class GenreListViewTests(TestCase):
@@ -45,3 +46,10 @@ class GenreListViewTests(TestCase):
         # Cached view should NOT include Z-Test
         self.assertEqual(response1.content, response2.content)
 
+    def test_genre_queryset_is_cached_until_genres_change(self):
+        """Genre list is cached at the ORM layer and invalidated on save"""
+        self.client.get(reverse('genre_list'))
+        self.assertIsNotNone(cache.get(GENRE_LIST_CACHE_KEY))
+
+        Genre.objects.create(name="Blues")
+        self.assertIsNone(cache.get(GENRE_LIST_CACHE_KEY))
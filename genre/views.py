@@ -3,13 +3,17 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 
 from .models import Genre
+from .signals import cached_genre_list
 
 class GenreListView(ListView):
     model = Genre
     template_name = 'genre_list.html'
     context_object_name = 'genres'
-    ordering = ['name']
 
     @method_decorator(cache_page(60 * 15)) # Cache for 15 minutes
     def dispatch(self, *args, **kwargs):
         return super().dispatch(*args, **kwargs)
+
+    def get_queryset(self):
+        # shared across users and survives cache_page misses; see genre.signals
+        return cached_genre_list()
@@ -3,8 +3,20 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 
 from movie.models import Movie
+from movie.names import FETCH_CHUNK_SIZE, resolve_name_ids
 from director.models import Director
 from genre.models import Genre
+from genre.signals import invalidate_genre_list
+from movie.signals import invalidate_movie_list
+
+# Rows upserted per INSERT ... ON CONFLICT statement
+BATCH_SIZE = 1000
+
+# Everything but the movie_id key is refreshed when a movie already exists
+MOVIE_UPDATE_FIELDS = [
+    'name', 'slug', 'ratings', 'year', 'total_views', 'total_likes',
+    'in_lists', 'description', 'length', 'poster_url',
+]
 
 
 class Command(BaseCommand):
@@ -22,54 +34,112 @@ class Command(BaseCommand):
 
         self.stdout.write(self.style.NOTICE(f'Importing movies from: {csv_path}'))
 
+        # name -> id, filled as each batch introduces new names
+        self.director_ids = {}
+        self.genre_ids = {}
+
         try:
-            with open(csv_path, newline='', encoding='utf-8') as f:
+            with open(csv_path, newline='', encoding='utf-8') as f, transaction.atomic():
                 reader = csv.DictReader(f)
 
+                # movie_id -> row; a later duplicate row wins, as update_or_create did
+                batch = {}
                 for row in reader:
                     if not row.get('name'):
                         continue
 
-                    with transaction.atomic():
-                        movie, created = Movie.objects.update_or_create(
-                            movie_id=int(row['movie_id']),
-                            defaults={
-                                'name': row['name'],
-                                'slug': row['slug'],
-                                'ratings': float(row['ratings']) if row['ratings'] else None,
-                                'year': None,  # CSV does not include year
-                                'total_views': int(row['total_views']) if row['total_views'] else None,
-                                'total_likes': int(row['total_likes']) if row['total_likes'] else None,
-                                'in_lists': int(row['in_lists']) if row['in_lists'] else None,
-                                'description': None,
-                                'length': int(row['length']) if row['length'] else None,
-                                'poster_url': row['poster_url'],
-                            }
-                        )
-
-                        # Directors
-                        directors_raw = row['directors']
-                        director_names = [d.strip() for d in directors_raw.split(',')]
-
-                        movie.directors.clear()
-                        for name in director_names:
-                            director, _ = Director.objects.get_or_create(name=name)
-                            movie.directors.add(director)
-
-                        # Genres
-                        genres_raw = row['genres']
-                        genre_names = [g.strip() for g in genres_raw.split(',')]
-
-                        movie.genres.clear()
-                        for g in genre_names:
-                            genre, _ = Genre.objects.get_or_create(name=g)
-                            movie.genres.add(genre)
-
-                        action = 'Created' if created else 'Updated'
-                        self.stdout.write(self.style.SUCCESS(f'{action} movie: {movie.name}'))
+                    batch[int(row['movie_id'])] = row
+                    if len(batch) >= BATCH_SIZE:
+                        self.import_batch(list(batch.values()))
+                        batch = {}
+
+                if batch:
+                    self.import_batch(list(batch.values()))
 
         except FileNotFoundError:
             self.stdout.write(self.style.ERROR(f'File not found: {csv_path}'))
             return
 
+        # everything was bulk-written without post_save, so drop the cached lists
+        invalidate_genre_list()
+        invalidate_movie_list()
+
         self.stdout.write(self.style.SUCCESS('Movie import complete!'))
+
+    def build_movie(self, row):
+        return Movie(
+            movie_id=int(row['movie_id']),
+            name=row['name'],
+            slug=row['slug'],
+            ratings=float(row['ratings']) if row['ratings'] else None,
+            year=None,  # CSV does not include year
+            total_views=int(row['total_views']) if row['total_views'] else None,
+            total_likes=int(row['total_likes']) if row['total_likes'] else None,
+            in_lists=int(row['in_lists']) if row['in_lists'] else None,
+            description=None,
+            length=int(row['length']) if row['length'] else None,
+            poster_url=row['poster_url'],
+        )
+
+    def import_batch(self, rows):
+        '''Upsert one batch of CSV rows with a single bulk statement'''
+        movies = [self.build_movie(row) for row in rows]
+        movie_ids = [movie.movie_id for movie in movies]
+        existing = set(
+            Movie.objects.filter(movie_id__in=movie_ids)
+            .values_list('movie_id', flat=True).iterator(chunk_size=FETCH_CHUNK_SIZE)
+        )
+
+        Movie.objects.bulk_create(
+            movies,
+            update_conflicts=True,
+            unique_fields=['movie_id'],
+            update_fields=MOVIE_UPDATE_FIELDS,
+        )
+        movie_pks = dict(
+            Movie.objects.filter(movie_id__in=movie_ids)
+            .values_list('movie_id', 'id').iterator(chunk_size=FETCH_CHUNK_SIZE)
+        )
+
+        movie_directors = [self.split_names(row['directors']) for row in rows]
+        movie_genres = [self.split_names(row['genres']) for row in rows]
+        director_ids = self.director_ids
+        genre_ids = self.genre_ids
+        resolve_name_ids(Director, {name for names in movie_directors for name in names}, director_ids)
+        resolve_name_ids(Genre, {name for names in movie_genres for name in names}, genre_ids)
+
+        # Bring each movie's directors and genres in line with the CSV
+        movie_pk_list = list(movie_pks.values())
+        self.sync_relation(Movie.directors.through, 'director_id', movie_pk_list, {
+            (movie_pks[movie.movie_id], director_ids[name])
+            for movie, names in zip(movies, movie_directors) for name in names
+        })
+        self.sync_relation(Movie.genres.through, 'genre_id', movie_pk_list, {
+            (movie_pks[movie.movie_id], genre_ids[name])
+            for movie, names in zip(movies, movie_genres) for name in names
+        })
+
+        for movie in movies:
+            action = 'Updated' if movie.movie_id in existing else 'Created'
+            self.stdout.write(self.style.SUCCESS(f'{action} movie: {movie.name}'))
+
+    def sync_relation(self, through, target, movie_pk_list, wanted):
+        '''
+        Make the through rows for movie_pk_list exactly the (movie, target)
+        pairs in wanted, touching only the pairs that differ.
+        '''
+        current = {
+            (movie_pk, target_pk): pk
+            for pk, movie_pk, target_pk in through.objects.filter(movie_id__in=movie_pk_list)
+            .values_list('pk', 'movie_id', target).iterator(chunk_size=FETCH_CHUNK_SIZE)
+        }
+        stale = [pk for pair, pk in current.items() if pair not in wanted]
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        through.objects.bulk_create([
+            through(**{'movie_id': movie_pk, target: target_pk})
+            for movie_pk, target_pk in wanted.difference(current)
+        ])
+
+    def split_names(self, raw):
+        return [name.strip() for name in raw.split(',')]
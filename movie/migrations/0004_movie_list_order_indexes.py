@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-15 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('director', '0001_initial'),
+        ('genre', '0001_initial'),
+        ('movie', '0003_rename_users_rating_movie_ratings_movie_description_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-ratings', '-total_views', 'name'], name='movie_rating_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-total_views', '-ratings', 'name'], name='movie_views_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-total_likes', '-ratings', 'name'], name='movie_likes_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['name'], name='movie_name_idx'),
+        ),
+    ]
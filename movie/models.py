@@ -19,5 +19,14 @@ class Movie(models.Model):
     poster_url = models.URLField(blank=True, null=True)
     genres = models.ManyToManyField(Genre, related_name='movies', blank=True)
 
+    class Meta:
+        # One index per MovieListView ordering so a page is an index walk, not a sort
+        indexes = [
+            models.Index(fields=['-ratings', '-total_views', 'name'], name='movie_rating_order_idx'),
+            models.Index(fields=['-total_views', '-ratings', 'name'], name='movie_views_order_idx'),
+            models.Index(fields=['-total_likes', '-ratings', 'name'], name='movie_likes_order_idx'),
+            models.Index(fields=['name'], name='movie_name_idx'),
+        ]
+
     def __str__(self):
         return f'{self.name}'
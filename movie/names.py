@@ -0,0 +1,26 @@
+# Rows fetched per round trip when reading ids back
+FETCH_CHUNK_SIZE = 2000
+
+
+def resolve_name_ids(model, names, ids):
+    '''
+    Fill ids (name -> id) for every name in names, inserting the rows of
+    model (Genre, Director) that do not exist yet with one bulk insert.
+    Returns the names that were missing.
+    '''
+    wanted = set(names).difference(ids)
+    if not wanted:
+        return set()
+    # stream straight into the map rather than through a queryset cache
+    ids.update(
+        model.objects.filter(name__in=wanted)
+        .values_list('name', 'id').iterator(chunk_size=FETCH_CHUNK_SIZE)
+    )
+    misses = wanted.difference(ids)
+    if misses:
+        model.objects.bulk_create([model(name=name) for name in misses], ignore_conflicts=True)
+        ids.update(
+            model.objects.filter(name__in=misses)
+            .values_list('name', 'id').iterator(chunk_size=FETCH_CHUNK_SIZE)
+        )
+    return misses
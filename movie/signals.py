@@ -0,0 +1,28 @@
+import time
+
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from genre.models import Genre
+from .models import Movie
+
+# Cached movie list pages embed this version in their keys; bumping it
+# retires every cached page at once
+MOVIE_LIST_VERSION_KEY = 'movie:list:version'
+
+
+def movie_list_version():
+    # a clock value, so a version lost to eviction is never handed out again
+    return cache.get_or_set(MOVIE_LIST_VERSION_KEY, time.time_ns, None)
+
+
+@receiver([post_save, post_delete], sender=Movie)
+@receiver([post_save, post_delete], sender=Genre)
+@receiver(m2m_changed, sender=Movie.genres.through)
+@receiver(m2m_changed, sender=Movie.directors.through)
+def invalidate_movie_list(**kwargs):
+    '''Retire the cached movie list pages whenever what they show changes'''
+    # a fresh clock value rather than cache.incr, which re-sets the key with the
+    # default timeout on backends without a native incr (e.g. the file cache)
+    cache.set(MOVIE_LIST_VERSION_KEY, time.time_ns(), None)
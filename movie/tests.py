@@ -4,7 +4,7 @@ from django.core.cache import cache
 
 from movie.models import Movie
 from genre.models import Genre
-from person.models import Director  # adjust if your app name differs
+from director.models import Director
 
 
 class MovieListViewTests(TestCase):
@@ -22,6 +22,7 @@ class MovieListViewTests(TestCase):
 
         # Create movies
         self.m1 = Movie.objects.create(
+            movie_id=1,
             name="Movie A",
             ratings=8.5,
             total_views=500,
@@ -32,6 +33,7 @@ class MovieListViewTests(TestCase):
         self.m1.directors.add(self.dir1)
 
         self.m2 = Movie.objects.create(
+            movie_id=2,
             name="Movie B",
             ratings=9.0,
             total_views=800,
@@ -42,58 +44,105 @@ class MovieListViewTests(TestCase):
         self.m2.directors.add(self.dir2)
 
     def test_status_code(self):
-        response = self.client.get(reverse('movie-list'))
+        response = self.client.get(reverse('movie_list'))
         self.assertEqual(response.status_code, 200)
 
     def test_correct_template(self):
-        response = self.client.get(reverse('movie-list'))
+        response = self.client.get(reverse('movie_list'))
         self.assertTemplateUsed(response, 'movie_list.html')
 
     def test_pagination(self):
-        response = self.client.get(reverse('movie-list'))
+        response = self.client.get(reverse('movie_list'))
         self.assertTrue('is_paginated' in response.context)
         self.assertEqual(response.context['paginator'].per_page, 20)
 
+    def test_cursor_pagination_continues_after_movie(self):
+        response = self.client.get(reverse('movie_list'), {'order': 'name', 'after': self.m1.pk})
+        self.assertEqual(list(response.context['movies']), [self.m2])
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_next_link_follows_the_cursor(self):
+        for i in range(3, 22):
+            Movie.objects.create(movie_id=i, name=f"Movie {i:02}", slug=f"movie-{i}")
+
+        response = self.client.get(reverse('movie_list'), {'order': 'name', 'genre': 'Drama'})
+        self.assertNotContains(response, 'after=')
+
+        response = self.client.get(reverse('movie_list'), {'order': 'name'})
+        cursor = response.context['next_cursor']
+        self.assertContains(response, f'?order=name&amp;after={cursor}')
+
+        response = self.client.get(reverse('movie_list'), {'order': 'name', 'after': cursor})
+        self.assertEqual([m.name for m in response.context['movies']], ["Movie B"])
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get(reverse('movie_list'), {'after': 'abc'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_csv_export_streams_filtered_movies(self):
+        response = self.client.get(reverse('movie_export'), {'genre': 'Drama'})
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:2], ['movie_id', 'name'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn("Movie B", lines[1])
+
     def test_search_filter(self):
-        response = self.client.get(reverse('movie-list'), {'q': 'Movie A'})
+        response = self.client.get(reverse('movie_list'), {'q': 'Movie A'})
         movies = response.context['movies']
         self.assertEqual(movies.count(), 1)
         self.assertEqual(movies[0], self.m1)
 
     def test_genre_filter(self):
-        response = self.client.get(reverse('movie-list'), {'genre': 'Drama'})
+        response = self.client.get(reverse('movie_list'), {'genre': 'Drama'})
         movies = response.context['movies']
         self.assertEqual(movies.count(), 1)
         self.assertEqual(movies[0], self.m2)
 
     def test_ordering_rating(self):
-        response = self.client.get(reverse('movie-list'), {'order': 'rating'})
+        response = self.client.get(reverse('movie_list'), {'order': 'rating'})
         movies = list(response.context['movies'])
         self.assertEqual(movies[0], self.m2)  # higher rating first
 
     def test_ordering_views(self):
-        response = self.client.get(reverse('movie-list'), {'order': 'views'})
+        response = self.client.get(reverse('movie_list'), {'order': 'views'})
         movies = list(response.context['movies'])
         self.assertEqual(movies[0], self.m2)  # more views first
 
     def test_ordering_likes(self):
-        response = self.client.get(reverse('movie-list'), {'order': 'likes'})
+        response = self.client.get(reverse('movie_list'), {'order': 'likes'})
         movies = list(response.context['movies'])
         self.assertEqual(movies[0], self.m2)  # more likes first
 
     def test_ordering_name(self):
-        response = self.client.get(reverse('movie-list'), {'order': 'name'})
+        response = self.client.get(reverse('movie_list'), {'order': 'name'})
         movies = list(response.context['movies'])
         self.assertEqual([m.name for m in movies], ["Movie A", "Movie B"])
 
     def test_context_values(self):
-        response = self.client.get(reverse('movie-list'), {'q': 'abc', 'genre': 'Drama', 'order': 'views'})
+        response = self.client.get(reverse('movie_list'), {'q': 'abc', 'genre': 'Drama', 'order': 'views'})
         self.assertEqual(response.context['q'], 'abc')
         self.assertEqual(response.context['current_genre'], 'Drama')
         self.assertEqual(response.context['current_order'], 'views')
         self.assertIn(self.genre1, response.context['genres'])
         self.assertIn(self.genre2, response.context['genres'])
 
+    def test_list_page_is_cached_until_a_movie_changes(self):
+        self.client.get(reverse('movie_list'), {'order': 'name'})
+        with self.assertNumQueries(0):
+            self.client.get(reverse('movie_list'), {'order': 'name'})
+
+        self.m1.name = "Movie Z"
+        self.m1.save()
+        response = self.client.get(reverse('movie_list'), {'order': 'name'})
+        self.assertEqual([m.name for m in response.context['movies']], ["Movie B", "Movie Z"])
+
+    def test_genre_sidebar_refreshes_after_genre_change(self):
+        self.client.get(reverse('movie_list'))
+        horror = Genre.objects.create(name="Horror")
+        response = self.client.get(reverse('movie_list'))
+        self.assertIn(horror, response.context['genres'])
+
 
 class MovieDetailViewTests(TestCase):
 
@@ -104,6 +153,7 @@ class MovieDetailViewTests(TestCase):
         self.director = Director.objects.create(name="James Cameron")
 
         self.movie = Movie.objects.create(
+            movie_id=1,
             name="Avatar",
             slug="avatar",
             ratings=8.0,
@@ -114,30 +164,30 @@ class MovieDetailViewTests(TestCase):
         self.movie.directors.add(self.director)
 
     def test_status_code(self):
-        response = self.client.get(reverse('movie-detail', kwargs={'slug': 'avatar'}))
+        response = self.client.get(reverse('movie_detail', kwargs={'slug': 'avatar'}))
         self.assertEqual(response.status_code, 200)
 
     def test_correct_template(self):
-        response = self.client.get(reverse('movie-detail', kwargs={'slug': 'avatar'}))
+        response = self.client.get(reverse('movie_detail', kwargs={'slug': 'avatar'}))
         self.assertTemplateUsed(response, 'movie_detail.html')
 
     def test_movie_is_correct(self):
-        response = self.client.get(reverse('movie-detail', kwargs={'slug': 'avatar'}))
+        response = self.client.get(reverse('movie_detail', kwargs={'slug': 'avatar'}))
         self.assertEqual(response.context['movie'], self.movie)
 
     def test_context_includes_directors_and_genres(self):
-        response = self.client.get(reverse('movie-detail', kwargs={'slug': 'avatar'}))
+        response = self.client.get(reverse('movie_detail', kwargs={'slug': 'avatar'}))
         self.assertIn(self.director, response.context['directors'])
         self.assertIn(self.genre, response.context['genres'])
 
     def test_caching(self):
-        response1 = self.client.get(reverse('movie-detail', kwargs={'slug': 'avatar'}))
+        response1 = self.client.get(reverse('movie_detail', kwargs={'slug': 'avatar'}))
 
         # Change something that *would* appear
         self.movie.name = "Avatar Updated"
         self.movie.save()
 
-        response2 = self.client.get(reverse('movie-detail', kwargs={'slug': 'avatar'}))
+        response2 = self.client.get(reverse('movie_detail', kwargs={'slug': 'avatar'}))
 
         # Cached output should NOT change
         self.assertEqual(response1.content, response2.content)
@@ -1,7 +1,8 @@
 from django.urls import path
-from .views import MovieListView, MovieDetailView
+from .views import MovieListView, MovieExportView, MovieDetailView
 
 urlpatterns = [
     path('', MovieListView.as_view(), name='movie_list'),
+    path('movies.csv', MovieExportView.as_view(), name='movie_export'),
     path('movie/<slug:slug>/', MovieDetailView.as_view(), name='movie_detail'),
 ]
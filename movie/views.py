@@ -1,56 +1,163 @@
-from django.db.models import Q
+import csv
+import hashlib
+from itertools import chain
+
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.views.generic import ListView, DetailView
+from django.views.generic import ListView, DetailView, View
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import cache_page
 
 from .models import Movie
+from director.models import Director
 from genre.models import Genre
+from genre.signals import cached_genre_list
+from .signals import movie_list_version
 
 
-class MovieListView(ListView):
-    model = Movie
-    template_name = 'movie_list.html'
-    context_object_name = 'movies'
-    paginate_by = 20
+# ?order= value -> ORDER BY; id last keeps pages stable and rides the index rowid
+LIST_ORDERINGS = {
+    'rating': ('-ratings', '-total_views', 'name', 'id'),
+    'views': ('-total_views', '-ratings', 'name', 'id'),
+    'likes': ('-total_likes', '-ratings', 'name', 'id'),
+    'name': ('name', 'id'),
+}
+# default ordering: popular first (by rating then views)
+DEFAULT_LIST_ORDER = 'rating'
 
-    def get_queryset(self):
-        qs = Movie.objects.all().prefetch_related('genres', 'directors')
+# Rendered list pages live this long unless a movie change retires them first
+MOVIE_LIST_TIMEOUT = 60 * 5
+
+# Columns written by MovieExportView, in order
+EXPORT_FIELDS = ('movie_id', 'name', 'slug', 'year', 'ratings', 'total_views', 'total_likes', 'in_lists', 'length')
+
+
+def keyset_after(ordering, row):
+    '''
+    Q matching the rows that sort strictly after row under ordering.
+    NULLs are treated as the smallest value, as SQLite orders them.
+    '''
+    after = Q(pk__in=[])
+    equal = Q()
+    for key in ordering:
+        field = key.lstrip('-')
+        value = getattr(row, field)
+        if value is None:
+            beyond = Q(pk__in=[]) if key.startswith('-') else Q(**{f'{field}__isnull': False})
+            same = Q(**{f'{field}__isnull': True})
+        elif key.startswith('-'):
+            beyond = Q(**{f'{field}__lt': value}) | Q(**{f'{field}__isnull': True})
+            same = Q(**{field: value})
+        else:
+            beyond = Q(**{f'{field}__gt': value})
+            same = Q(**{field: value})
+        after |= equal & beyond
+        equal &= same
+    return after
+
+
+class MovieFilterMixin:
+    '''The ?q=, ?genre= and ?order= filters shared by the movie list and its CSV export'''
+
+    def get_ordering(self):
+        order = (self.request.GET.get('order') or '').lower()
+        return LIST_ORDERINGS.get(order, LIST_ORDERINGS[DEFAULT_LIST_ORDER])
 
-        # Search
+    def get_filtered_queryset(self):
+        qs = Movie.objects.all()
+
+        # Search; relation filters are semi-joins so no DISTINCT is needed
         q = self.request.GET.get('q')
         if q:
-            qs = qs.filter(Q(name__icontains=q) | Q(directors__name__icontains=q)).distinct()
+            directed = Movie.directors.through.objects.filter(movie_id=OuterRef('pk'), director__name__icontains=q)
+            qs = qs.filter(Q(name__icontains=q) | Exists(directed))
 
         genre = self.request.GET.get('genre')
         if genre:
-            qs = qs.filter(genres__name__iexact=genre).distinct()
+            qs = qs.filter(Exists(Movie.genres.through.objects.filter(movie_id=OuterRef('pk'), genre__name__iexact=genre)))
+
+        return qs.order_by(*self.get_ordering())
 
-        # Ordering
-        order = (self.request.GET.get('order') or '').lower()
-        if order == 'rating':
-            qs = qs.order_by('-ratings', '-total_views', 'name')
-        elif order == 'views':
-            qs = qs.order_by('-total_views', '-ratings', 'name')
-        elif order == 'likes':
-            qs = qs.order_by('-total_likes', '-ratings', 'name')
-        elif order == 'name':
-            qs = qs.order_by('name')
-        else:
-            # default ordering: popular first (by rating then views)
-            qs = qs.order_by('-ratings', '-total_views', 'name')
 
-        return qs
+class MovieListView(MovieFilterMixin, ListView):
+    model = Movie
+    template_name = 'movie_list.html'
+    context_object_name = 'movies'
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        # one cached page per query string, keyed on the current list version
+        query = hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+        key = f'movie:list:{movie_list_version()}:{query}'
+        content = cache.get(key)
+        if content is not None:
+            return HttpResponse(content)
+
+        response = super().get(request, *args, **kwargs)
+        response.add_post_render_callback(lambda r: cache.set(key, r.content, MOVIE_LIST_TIMEOUT))
+        return response
+
+    def get_queryset(self):
+        return self.get_filtered_queryset().prefetch_related('genres', 'directors')
+
+    def paginate_queryset(self, queryset, page_size):
+        '''
+        ?after=<movie pk> continues the listing after that movie without an
+        OFFSET scan or COUNT; without it the usual ?page= pagination applies.
+        '''
+        after = self.request.GET.get('after')
+        if after is None:
+            return super().paginate_queryset(queryset, page_size)
+
+        try:
+            last = Movie.objects.only(*(key.lstrip('-') for key in self.get_ordering())).get(pk=int(after))
+        except (ValueError, Movie.DoesNotExist):
+            raise Http404('Invalid cursor')
+
+        movies = list(queryset.filter(keyset_after(self.get_ordering(), last))[:page_size + 1])
+        return (None, None, movies[:page_size], len(movies) > page_size)
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx['q'] = self.request.GET.get('q', '')
         ctx['current_genre'] = self.request.GET.get('genre', '')
         ctx['current_order'] = self.request.GET.get('order', '')
-        ctx['genres'] = Genre.objects.all()
+        ctx['genres'] = cached_genre_list()
+
+        # cursor for ?after=, set whenever another page follows this one
+        page_obj = ctx['page_obj']
+        has_next = page_obj.has_next() if page_obj else ctx['is_paginated']
+        movies = list(ctx['movies'])
+        ctx['next_cursor'] = movies[-1].pk if has_next and movies else None
         return ctx
 
 
+class Echo:
+    '''File-like object whose write hands the line back to csv.writer's caller'''
+
+    def write(self, value):
+        return value
+
+
+class MovieExportView(MovieFilterMixin, View):
+    '''
+    The movie list as CSV, with the same ?q=, ?genre= and ?order= filters,
+    streamed row by row so large exports never sit in memory.
+    '''
+
+    def get(self, request, *args, **kwargs):
+        writer = csv.writer(Echo())
+        rows = self.get_filtered_queryset().values_list(*EXPORT_FIELDS).iterator(chunk_size=2000)
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in chain([EXPORT_FIELDS], rows)),
+            content_type='text/csv',
+        )
+        response['Content-Disposition'] = 'attachment; filename="movies.csv"'
+        return response
+
+
 @method_decorator(cache_page(60 * 15), name='dispatch') # Cache for 15 minutes
 class MovieDetailView(DetailView):
     model = Movie
@@ -60,7 +167,14 @@ class MovieDetailView(DetailView):
     slug_url_kwarg = 'slug'
 
     def get_queryset(self):
-        return Movie.objects.all().prefetch_related('genres', 'directors')
+        # only the columns the detail page renders, relations in one query each
+        return Movie.objects.only(
+            'id', 'name', 'slug', 'ratings', 'year', 'total_views', 'total_likes',
+            'description', 'length', 'poster_url',
+        ).prefetch_related(
+            Prefetch('directors', queryset=Director.objects.only('id', 'name')),
+            Prefetch('genres', queryset=Genre.objects.only('id', 'name')),
+        )
 
     def get_object(self, queryset=None):
         queryset = queryset or self.get_queryset()
@@ -69,6 +183,7 @@ class MovieDetailView(DetailView):
 
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
-        ctx['directors'] = self.object.directors.all()
-        ctx['genres'] = self.object.genres.all()
+        # materialized once so the template can walk them repeatedly
+        ctx['directors'] = list(self.object.directors.all())
+        ctx['genres'] = list(self.object.genres.all())
         return ctx
@@ -1,7 +1,25 @@
-from unittest.mock import patch, AsyncMock
-from django.test import TestCase
+import math
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest.mock import ANY, patch, AsyncMock
+from asgiref.sync import async_to_sync
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 from django.http import HttpResponseBadRequest
+import httpx
+import numpy as np
+
+from director.models import Director
+from genre.models import Genre
+from movie.models import Movie
+from movie.names import resolve_name_ids
+from recommender import views
+from recommender.views import (
+    bulk_save_movies, fetch_and_save_all, fetch_html, get_movies_from_db_by_ids, parse_films_list,
+    scrape_all_watched,
+)
+from utils.recommendation_engine import MovieRecommender, top_k_positions
 
 
 class RecommenderViewTests(TestCase):
@@ -18,9 +36,14 @@ class RecommenderViewTests(TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertIsInstance(response, HttpResponseBadRequest)
 
-    @patch("movie.views.engine.MovieRecommender.get_recommendations")
-    @patch("movie.views.get_movies_from_db_by_ids")
-    @patch("movie.views.scrape_all_watched")
+    def test_post_invalid_username_returns_400(self):
+        """Usernames are only letters, digits and underscores; anything else is not scraped."""
+        response = self.client.post(reverse('recommender'), {'username': '../admin'})
+        self.assertEqual(response.status_code, 400)
+
+    @patch("recommender.views.engine.MovieRecommender.get_recommendations")
+    @patch("recommender.views.get_movies_from_db_by_ids", new_callable=AsyncMock)
+    @patch("recommender.views.scrape_all_watched", new_callable=AsyncMock)
     def test_post_successful_flow(self, mock_scrape, mock_db_fetch, mock_recs):
         """
         Full POST flow:
@@ -30,21 +53,14 @@ class RecommenderViewTests(TestCase):
         """
 
         # 1) Fake scraped films
-        mock_scrape.return_value = AsyncMock()
         mock_scrape.return_value = ([{'id': '123', 'slug': 'test-film'}], 1)
 
-        # 2) Fake movie objects from DB
-        class FakeMovie:
-            slug = 'test-film'
-            name = 'Fake Movie'
-            year = 2020
-            ratings = 4.2
-
-        mock_db_fetch.return_value = AsyncMock()
-        mock_db_fetch.return_value = [FakeMovie()]
+        # 2) Fake movie rows from DB
+        mock_db_fetch.return_value = [
+            {'slug': 'test-film', 'name': 'Fake Movie', 'year': 2020, 'ratings': 4.2}
+        ]
 
         # 3) Fake recommendation DataFrame-like object
-        mock_recs.return_value = AsyncMock()
         mock_recs.return_value.fillna.return_value.to_dict.return_value = [
             {'slug': 'recommended-1', 'name': 'Recommended Movie'}
         ]
@@ -67,6 +83,324 @@ class RecommenderViewTests(TestCase):
         self.assertIsNone(ctx['recommender_error'])
 
         # Ensure mocked functions were called correctly
-        mock_scrape.assert_called_once_with('john', concurrency=6)
-        mock_db_fetch.assert_awaited()
-        mock_recs.assert_called_once()
+        mock_scrape.assert_called_once_with(ANY, 'john', concurrency=6)
+        mock_db_fetch.assert_awaited_once_with(['123'])
+        mock_recs.assert_called_once_with(mock_db_fetch.return_value, n_recommendations=12, min_popularity=50)
+
+
+class ParseFilmsListTests(TestCase):
+
+    def test_extracts_id_and_slug_from_poster_grid(self):
+        """Each poster li yields its film id and slug."""
+        html = '''
+        <div class="poster-grid"><ul>
+          <li><div class="react-component" data-item-slug="film-a" data-film-id="1"></div></li>
+          <li><div data-film-slug="film-b" data-film-id="2"></div></li>
+        </ul></div>
+        '''
+        self.assertEqual(parse_films_list(html), [
+            {'id': '1', 'slug': 'film-a'},
+            {'id': '2', 'slug': 'film-b'},
+        ])
+
+    def test_page_without_poster_grid_returns_empty_list(self):
+        """A page past the last one has no grid and yields no films."""
+        self.assertEqual(parse_films_list('<html><body></body></html>'), [])
+
+
+class FetchHtmlTests(TestCase):
+
+    def setUp(self):
+        views._throttled_until = 0.0
+
+    async def fetch(self, statuses, headers=None):
+        responses = iter(statuses)
+
+        def handler(request):
+            return httpx.Response(next(responses), headers=headers, text='<html>ok</html>')
+
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await fetch_html(client, 'https://letterboxd.com/film/x/')
+
+    @patch('recommender.views.asyncio.sleep', new_callable=AsyncMock)
+    def test_retries_throttled_requests_honouring_retry_after(self, mock_sleep):
+        """A 429 is retried after the Retry-After delay."""
+        html = async_to_sync(self.fetch)([429, 200], headers={'Retry-After': '7'})
+
+        self.assertEqual(html, '<html>ok</html>')
+        self.assertAlmostEqual(mock_sleep.await_args.args[0], 7, places=0)
+
+    @patch('recommender.views.asyncio.sleep', new_callable=AsyncMock)
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Persistent 503s end in None rather than retrying forever."""
+        html = async_to_sync(self.fetch)([503] * (views.MAX_RETRIES + 1))
+
+        self.assertIsNone(html)
+        self.assertEqual(mock_sleep.await_count, views.MAX_RETRIES)
+
+    def test_client_errors_are_not_retried(self):
+        """A 404 (e.g. unknown username) returns None immediately."""
+        self.assertIsNone(async_to_sync(self.fetch)([404]))
+
+
+class ScrapeAllWatchedTests(TestCase):
+
+    def test_stops_at_first_page_without_films(self):
+        """Speculatively fetched pages past the last one are discarded."""
+        def page_html(slugs):
+            items = ''.join(
+                f'<li><div data-film-slug="{slug}" data-film-id="{i}"></div></li>'
+                for i, slug in enumerate(slugs)
+            )
+            return f'<div class="poster-grid"><ul>{items}</ul></div>'
+
+        pages = {
+            'https://letterboxd.com/john/films/': page_html(['a', 'b']),
+            'https://letterboxd.com/john/films/page/2/': page_html(['c']),
+        }
+
+        async def fake_fetch(client, url):
+            return pages.get(url, page_html([]))
+
+        with patch('recommender.views.fetch_html', side_effect=fake_fetch):
+            films, pages_scraped = async_to_sync(scrape_all_watched)(None, 'john', concurrency=4)
+
+        self.assertEqual([f['slug'] for f in films], ['a', 'b', 'c'])
+        self.assertEqual(pages_scraped, 2)
+
+
+class FetchAndSaveAllTests(TestCase):
+
+    def test_extracts_stats_and_ratings_for_each_film(self):
+        """Each film's fragments are parsed into details and saved in one batch."""
+        stats_html = (
+            '<div class="production-statistic-list">'
+            '<div class="production-statistic -watches"><a><span>1.2k</span></a></div>'
+            '<div class="production-statistic -lists"><a><span>30</span></a></div>'
+            '<div class="production-statistic -likes"><a><span>400</span></a></div>'
+            '</div>'
+        )
+
+        async def fake_fetch(client, url):
+            if url.endswith('/stats/'):
+                return stats_html
+            if url.endswith('/ratings-summary/'):
+                return '<a class="tooltip display-rating">3.9</a>'
+            return None
+
+        films = [{'id': 1, 'slug': 'a'}, {'id': 2, 'slug': 'b'}]
+        with patch('recommender.views.fetch_html', side_effect=fake_fetch), \
+                patch('recommender.views.bulk_save_movies', new_callable=AsyncMock) as mock_save:
+            saved = async_to_sync(fetch_and_save_all)(None, films, concurrency=2)
+
+        self.assertEqual(sorted(m['slug'] for m in saved), ['a', 'b'])
+        self.assertEqual(
+            {k: saved[0][k] for k in ('total_views', 'in_lists', 'total_likes', 'ratings')},
+            {'total_views': 1200, 'in_lists': 30, 'total_likes': 400, 'ratings': 3.9},
+        )
+        mock_save.assert_awaited_once_with(saved)
+
+    def test_film_page_that_cannot_be_parsed_is_skipped(self):
+        """One malformed film page costs only that film; the rest are still saved."""
+        def film_page(slug):
+            # an upcoming film's page has no release date
+            release = '' if slug == 'upcoming' else '<span class="releasedate"><a>2001</a></span>'
+            return (
+                f'<html><head><meta name="description" content="About {slug}"></head><body>'
+                f'<h1 class="primaryname"><span class="name">{slug.title()}</span></h1>{release}'
+                '<div id="tab-crew"><p><a>Varda</a></p></div></body></html>'
+            )
+
+        async def fake_fetch(client, url):
+            if '/csi/' in url:
+                return None
+            return film_page(url.rstrip('/').rsplit('/', 1)[-1])
+
+        slugs = ['a', 'b', 'upcoming', 'c', 'd', 'e']
+        films = [{'id': i, 'slug': slug} for i, slug in enumerate(slugs, 1)]
+        with patch('recommender.views.fetch_html', side_effect=fake_fetch), \
+                self.assertLogs('recommender.views', level='ERROR') as logs:
+            saved = async_to_sync(fetch_and_save_all)(None, films, concurrency=2)
+
+        self.assertIn('upcoming', logs.output[0])
+        self.assertEqual(sorted(m['slug'] for m in saved), ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(sorted(Movie.objects.values_list('slug', flat=True)), ['a', 'b', 'c', 'd', 'e'])
+
+    def test_failed_fragment_fetches_leave_fields_empty(self):
+        """A fragment that could not be fetched yields None fields instead of aborting the batch."""
+        async def fake_fetch(client, url):
+            return None
+
+        with patch('recommender.views.fetch_html', side_effect=fake_fetch), \
+                patch('recommender.views.bulk_save_movies', new_callable=AsyncMock):
+            saved = async_to_sync(fetch_and_save_all)(None, [{'id': 1, 'slug': 'a'}], concurrency=1)
+
+        self.assertEqual(
+            {k: saved[0][k] for k in ('total_views', 'in_lists', 'total_likes', 'ratings')},
+            {'total_views': None, 'in_lists': None, 'total_likes': None, 'ratings': None},
+        )
+
+
+class GetMoviesFromDbByIdsTests(TestCase):
+
+    def test_returns_projected_rows_across_chunks(self):
+        """Rows come back as dicts and every chunk of ids is queried."""
+        for i in range(1, 6):
+            Movie.objects.create(movie_id=i, name=f'Movie {i}', slug=f'movie-{i}', year=2000 + i)
+
+        rows = async_to_sync(get_movies_from_db_by_ids)([1, 2, 3, 5, 99], chunk_size=2)
+
+        self.assertEqual(sorted(r['slug'] for r in rows), ['movie-1', 'movie-2', 'movie-3', 'movie-5'])
+        self.assertEqual(set(rows[0]), {'slug', 'name', 'year', 'ratings'})
+
+
+class BulkSaveMoviesTests(TestCase):
+
+    def film(self, movie_id, slug, genres, directors):
+        return {
+            'movie_id': movie_id, 'name': slug.title(), 'slug': slug,
+            'genres': genres, 'directors': directors, 'cast': [],
+        }
+
+    def test_saves_movies_with_genres_and_directors(self):
+        """Movies, genres, directors and their links are all created."""
+        Genre.objects.create(name='Drama')
+
+        async_to_sync(bulk_save_movies)([
+            self.film('1', 'film-a', ['Drama', 'Comedy'], ['Nolan']),
+            self.film('2', 'film-b', ['Drama'], ['Nolan', 'Varda']),
+            {'movie_id': '3', 'slug': 'no-page'},
+        ])
+
+        self.assertEqual(Movie.objects.count(), 2)
+        self.assertEqual(Genre.objects.count(), 2)
+        self.assertEqual(Director.objects.count(), 2)
+        film_b = Movie.objects.get(movie_id=2)
+        self.assertEqual(sorted(d.name for d in film_b.directors.all()), ['Nolan', 'Varda'])
+        self.assertEqual([g.name for g in film_b.genres.all()], ['Drama'])
+
+    def test_saving_twice_updates_instead_of_duplicating(self):
+        """Re-importing a film refreshes its stats without duplicating rows."""
+        film = self.film('1', 'film-a', ['Drama'], ['Nolan'])
+
+        async_to_sync(bulk_save_movies)([{**film, 'total_views': 10}])
+        async_to_sync(bulk_save_movies)([{**film, 'total_views': 25}])
+
+        self.assertEqual(Movie.objects.count(), 1)
+        self.assertEqual(Movie.objects.get().total_views, 25)
+        self.assertEqual(Movie.objects.get().genres.count(), 1)
+
+    def test_failed_fragments_keep_stored_stats(self):
+        """A re-scrape whose stats and ratings fetches failed does not blank them out."""
+        film = self.film('1', 'film-a', ['Drama'], ['Nolan'])
+        stats = {'total_views': 1200, 'in_lists': 30, 'total_likes': 400, 'ratings': Decimal('3.9')}
+
+        async_to_sync(bulk_save_movies)([{**film, **stats}])
+        async_to_sync(bulk_save_movies)([{**film, **dict.fromkeys(stats), 'name': 'Film A (2001)'}])
+
+        movie = Movie.objects.get()
+        self.assertEqual(movie.name, 'Film A (2001)')
+        self.assertEqual(
+            {field: getattr(movie, field) for field in stats},
+            stats,
+        )
+
+    def test_deleted_genre_is_recreated_on_next_save(self):
+        """Deleting a genre makes the next save that uses it create it again."""
+        async_to_sync(bulk_save_movies)([self.film('1', 'film-a', ['Drama'], ['Nolan'])])
+        Genre.objects.get(name='Drama').delete()
+
+        async_to_sync(bulk_save_movies)([self.film('2', 'film-b', ['Drama'], ['Nolan'])])
+
+        self.assertEqual([g.name for g in Movie.objects.get(movie_id=2).genres.all()], ['Drama'])
+
+    def test_failed_save_leaves_no_ids_behind(self):
+        """Genres inserted by a rolled-back save are inserted again by the next one."""
+        with self.assertRaises(ValueError):
+            async_to_sync(bulk_save_movies)([self.film('not-a-number', 'film-a', ['Noir'], ['Nolan'])])
+
+        async_to_sync(bulk_save_movies)([self.film('2', 'film-b', ['Noir'], ['Nolan'])])
+
+        self.assertEqual([g.name for g in Movie.objects.get(movie_id=2).genres.all()], ['Noir'])
+
+    def test_stored_names_are_resolved_with_one_query(self):
+        """Names that already exist are looked up without an insert."""
+        Genre.objects.create(name='Drama')
+        ids = {}
+
+        with self.assertNumQueries(1):
+            created = resolve_name_ids(Genre, ['Drama'], ids)
+
+        self.assertEqual(ids, {'Drama': Genre.objects.get().pk})
+        self.assertEqual(created, set())
+
+
+class TopKPositionsTests(SimpleTestCase):
+
+    scores = np.array([1.0, 3.0, 3.0, 2.0, 3.0])
+
+    def test_ties_go_to_the_earlier_position(self):
+        """Equal scores are ranked by position, as nlargest(keep='first') does."""
+        self.assertEqual(top_k_positions(self.scores, np.arange(5), 2).tolist(), [1, 2])
+
+    def test_k_at_least_len_returns_everything_sorted(self):
+        """Asking for more than there are returns all positions, best first."""
+        self.assertEqual(top_k_positions(self.scores, np.arange(5), 10).tolist(), [1, 2, 4, 3, 0])
+
+    def test_k_not_positive_returns_nothing(self):
+        """k of zero or less selects no positions."""
+        self.assertEqual(top_k_positions(self.scores, np.arange(5), 0).tolist(), [])
+        self.assertEqual(top_k_positions(self.scores, np.arange(5), -1).tolist(), [])
+
+
+# Tiny catalogue: Alpha is the watched film; Golf ties Bravo exactly, Echo is
+# unrated and Foxtrot is below the popularity cut, so neither is recommended
+MOVIES_CSV = """name,slug,year,length,ratings,genres,total_likes,poster_url
+Alpha,alpha,2000,100,4.0,Drama,5000,
+Bravo,bravo,2000,100,4.0,Drama,5000,
+Charlie,charlie,2000,100,4.0,Comedy,5000,
+Delta,delta,2000,100,3.0,Drama,5000,
+Echo,echo,2000,100,,Drama,5000,
+Foxtrot,foxtrot,2000,100,4.0,Drama,10,
+Golf,golf,2000,100,4.0,Drama,5000,
+"""
+
+
+class MovieRecommenderTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'movies.csv'
+            path.write_text(MOVIES_CSV)
+            cls.recommender = MovieRecommender(path)
+
+    def test_recommendations_for_known_user(self):
+        """Scores follow the weighted components; ties keep catalogue order."""
+        recs = self.recommender.get_recommendations(
+            [{'name': 'alpha!', 'year': 2000, 'ratings': 5.0}], n_recommendations=10, min_popularity=1000,
+        )
+
+        self.assertEqual(recs['slug'].tolist(), ['bravo', 'golf', 'delta', 'charlie'])
+        popularity = math.log10(5001) / 5.0 * 0.10
+        expected = [
+            0.40 + 0.10 + 0.16 + popularity + 0.20,  # matching genre, rated 4.0
+            0.40 + 0.10 + 0.16 + popularity + 0.20,
+            0.40 + 0.10 + 0.12 + popularity + 0.20,  # matching genre, rated 3.0
+            0.16 + popularity + 0.20,                # no genre overlap
+        ]
+        for score, want in zip(recs['recommendation_score'], expected):
+            self.assertAlmostEqual(score, want)
+
+    def test_top_n_is_a_prefix_of_the_full_ranking(self):
+        """Asking for fewer recommendations cuts the same ranking short."""
+        recs = self.recommender.get_recommendations(
+            [{'name': 'Alpha', 'ratings': 5.0}], n_recommendations=2, min_popularity=1000,
+        )
+        self.assertEqual(recs['slug'].tolist(), ['bravo', 'golf'])
+
+    def test_unmatched_user_raises(self):
+        """A user with no catalogue matches cannot be recommended for."""
+        with self.assertRaises(ValueError):
+            self.recommender.get_recommendations([{'name': 'Nothing Like It'}])
@@ -1,44 +1,119 @@
 import asyncio
 import logging
+import time
 
 from asgiref.sync import sync_to_async
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 import httpx
 
+from django.db import transaction
 from django.shortcuts import render
 from django.http import HttpResponseBadRequest
 
 from movie.models import Movie
+from movie.names import resolve_name_ids
 from utils import extractors, recommendation_engine as engine
 from director.models import Director
 from genre.models import Genre
+from genre.signals import invalidate_genre_list
+from movie.signals import invalidate_movie_list
 
 logger = logging.getLogger(__name__)
 
 LETTERBOXD_BASE = 'https://letterboxd.com'
+LETTERBOXD_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
+
+# Only the poster grid is needed from a /{username}/films/ page
+FILMS_LIST_STRAINER = SoupStrainer('div', class_='poster-grid')
+
+
+class FilmPageStrainer(SoupStrainer):
+    '''Materialize only the film page elements read by utils.extractors'''
+    TAGS = {'meta', 'script', 'h1'}
+    IDS = {'tab-genres', 'tab-cast', 'tab-crew'}
+    CLASSES = {'releasedate', 'text-footer'}
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        attrs = attrs or {}
+        return (
+            name in self.TAGS
+            or attrs.get('id') in self.IDS
+            or not self.CLASSES.isdisjoint(attrs.get('class', '').split())
+        )
+
+
+FILM_PAGE_STRAINER = FilmPageStrainer()
+
+
+def letterboxd_client():
+    '''
+    HTTP/2 client for Letterboxd: every request to the host is multiplexed
+    over a pooled connection instead of opening a socket per request.
+    '''
+    return httpx.AsyncClient(
+        http2=True,
+        headers=LETTERBOXD_HEADERS,
+        timeout=30.0,
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=100),
+    )
+
+
+# Throttling/transient statuses that are retried with backoff
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_RETRIES = 5
+MAX_BACKOFF = 60.0
+
+# Monotonic time before which no Letterboxd request is sent. Shared so that
+# one 429 pauses every in-flight worker instead of each burning its retries.
+_throttled_until = 0.0
+
+
+def retry_delay(resp: httpx.Response, attempt: int) -> float:
+    '''Seconds to wait before retrying: Retry-After if given, else 2**attempt'''
+    retry_after = resp.headers.get('Retry-After', '')
+    delay = float(retry_after) if retry_after.isdigit() else 2 ** attempt
+    return min(delay, MAX_BACKOFF)
+
 
 async def fetch_html(client: httpx.AsyncClient, url: str) -> str | None:
-    try:
-        resp = await client.get(url, follow_redirects=True, timeout=30.0)
-        resp.raise_for_status()
-        return resp.text
-    except httpx.HTTPStatusError as e:
-        logger.warning('HTTP error fetching %s: %s', url, e)
-        return None
-    except Exception as e:
-        logger.warning('Error fetching %s: %s', url, e)
-        return None
+    global _throttled_until
+
+    for attempt in range(MAX_RETRIES + 1):
+        wait = _throttled_until - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        try:
+            resp = await client.get(url, follow_redirects=True, timeout=30.0)
+            if resp.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+                delay = retry_delay(resp, attempt)
+                logger.info('HTTP %s fetching %s, retrying in %.0fs', resp.status_code, url, delay)
+                _throttled_until = max(_throttled_until, time.monotonic() + delay)
+                continue
+
+            resp.raise_for_status()
+            return resp.text
+        except httpx.HTTPStatusError as e:
+            logger.warning('HTTP error fetching %s: %s', url, e)
+            return None
+        except httpx.RequestError as e:
+            logger.warning('Error fetching %s: %s', url, e)
+            return None
 
 
 def parse_films_list(html):
     '''Return list of film dicts from a /{username}/films/ page'''
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, 'lxml', parse_only=FILMS_LIST_STRAINER)
     results = []
 
-    poster_items = soup.select('div.poster-grid>ul')[0].find_all('li')
+    grid = soup.find('div', class_='poster-grid')
+    poster_list = grid.find('ul') if grid else None
 
-    for item in poster_items:
-        react_component = item.find('div.react-component') or item.div
+    for item in (poster_list.children if poster_list else ()):
+        if getattr(item, 'name', None) != 'li':
+            continue
+
+        react_component = item.find('div', class_='react-component', recursive=False) or item.div
         movie_slug = react_component.get('data-item-slug') or react_component.get('data-film-slug')
         movie_id = react_component['data-film-id']
 
@@ -52,123 +127,207 @@ def parse_films_list(html):
 
 def parse_film_page(html):
     '''Best-effort extraction from an individual film page'''
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, 'lxml', parse_only=FILM_PAGE_STRAINER)
     data = {
         'name': extractors.extract_title(soup),
         'year': extractors.extract_year(soup),
         'description': extractors.extract_description(soup),
-        'genres': extractors.extract_genres(soup),
-        'cast': extractors.extract_cast(soup),
-        'directors': extractors.extract_directors(soup),
+        'genres': list(extractors.extract_genres(soup)),
+        'cast': list(extractors.extract_cast(soup)),
+        'directors': list(extractors.extract_directors(soup)),
         'length': extractors.extract_runtime(soup),
         'poster_url': extractors.extract_poster(soup),
     }
     return data
 
 
-# Use sync_to_async to run blocking DB operations in threadpool
-@sync_to_async
-def save_movie_from_data(movie_data):
-    genres = movie_data.pop('genres')
-    directors = movie_data.pop('directors')
-    casts = movie_data.pop('cast')
-
-    movie, _ = Movie.objects.get_or_create(
-        movie_id=movie_data.pop('movie_id'),
-        name=movie_data.pop('name'),
-        slug=movie_data.pop('slug'),
-        defaults=movie_data
-    )
-
-    for name in directors:
-        director, _ = Director.objects.get_or_create(name=name)
-        movie.directors.add(director)
+# Movie model fields filled in from scraped film details
+MOVIE_FIELDS = (
+    'movie_id', 'name', 'slug', 'ratings', 'year', 'total_views',
+    'total_likes', 'in_lists', 'description', 'length', 'poster_url',
+)
 
-    for name in genres:
-        genre, _ = Genre.objects.get_or_create(name=name)
-        movie.genres.add(genre)
+# Filled from the stats and ratings fragments, where None means the fetch failed
+FRAGMENT_FIELDS = ('ratings', 'total_views', 'total_likes', 'in_lists')
 
-
-async def scrape_all_watched(username, concurrency=6):
+# Use sync_to_async to run blocking DB operations in threadpool
+@sync_to_async
+def bulk_save_movies(movies_data):
+    '''
+    Save scraped movies with their directors and genres using one bulk
+    insert per table instead of get_or_create per row.
+    '''
+    movies_data = [data for data in movies_data if data.get('name')]
+    genre_names = {name for data in movies_data for name in data['genres']}
+    director_names = {name for data in movies_data for name in data['directors']}
+
+    # resolved per save, so a rolled-back save or a row deleted elsewhere
+    # never leaves a stale id behind
+    genre_ids = {}
+    director_ids = {}
+    with transaction.atomic():
+        new_genres = resolve_name_ids(Genre, genre_names, genre_ids)
+        resolve_name_ids(Director, director_names, director_ids)
+
+        # re-scraped movies get their latest stats instead of being skipped,
+        # but a failed fragment fetch keeps the stats already stored
+        movie_ids = [int(data['movie_id']) for data in movies_data]
+        stored = {
+            movie_id: values
+            for movie_id, *values in Movie.objects.filter(movie_id__in=movie_ids)
+            .values_list('movie_id', *FRAGMENT_FIELDS)
+        }
+        movies = []
+        for data in movies_data:
+            fields = {field: data.get(field) for field in MOVIE_FIELDS}
+            for field, value in zip(FRAGMENT_FIELDS, stored.get(int(data['movie_id']), ())):
+                if fields[field] is None:
+                    fields[field] = value
+            movies.append(Movie(**fields))
+
+        Movie.objects.bulk_create(
+            movies,
+            update_conflicts=True,
+            unique_fields=['movie_id'],
+            update_fields=[field for field in MOVIE_FIELDS if field != 'movie_id'],
+        )
+        movie_pks = dict(Movie.objects.filter(movie_id__in=movie_ids).values_list('movie_id', 'id'))
+
+        MovieGenre = Movie.genres.through
+        MovieDirector = Movie.directors.through
+        MovieGenre.objects.bulk_create([
+            MovieGenre(movie_id=movie_pks[int(data['movie_id'])], genre_id=genre_ids[name])
+            for data in movies_data for name in data['genres']
+        ], ignore_conflicts=True)
+        MovieDirector.objects.bulk_create([
+            MovieDirector(movie_id=movie_pks[int(data['movie_id'])], director_id=director_ids[name])
+            for data in movies_data for name in data['directors']
+        ], ignore_conflicts=True)
+
+    # none of the bulk writes above send signals; retire cached lists once committed
+    if new_genres:
+        invalidate_genre_list()
+    invalidate_movie_list()
+
+
+def is_valid_username(username):
+    '''Letterboxd usernames are ASCII letters, digits and underscores'''
+    # str methods instead of a regex: no pattern to compile or match per call
+    return username.isascii() and username.replace('_', '').isalnum()
+
+
+def films_page_url(username, page):
+    if page == 1:
+        return f'{LETTERBOXD_BASE}/{username}/films/'
+    return f'{LETTERBOXD_BASE}/{username}/films/page/{page}/'
+
+
+async def scrape_all_watched(client, username, concurrency=6):
     '''
     Scrapes all /{username}/films/ pages until no more film entries are found.
+    Pages are fetched speculatively, `concurrency` at a time.
     Returns (list_of_film_dicts, pages_scraped)
     '''
-    async with httpx.AsyncClient(headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}, timeout=30.0) as client:
-        page = 1
-        all_films = []
-        seen_urls = set()
-        while True:
-            if page == 1:
-                url = f'{LETTERBOXD_BASE}/{username}/films/'
-            else:
-                url = f'{LETTERBOXD_BASE}/{username}/films/page/{page}/'
-
-            html = await fetch_html(client, url)
-            if not html:
-                # stop on error/404
+    page = 1
+    # slug -> film, keeps first-seen order and doubles as the dedup set
+    all_films = {}
+    done = False
+    while not done:
+        htmls = await asyncio.gather(*(
+            fetch_html(client, films_page_url(username, p))
+            for p in range(page, page + concurrency)
+        ))
+
+        for html in htmls:
+            # stop on error/404, or on a page with no film posters at all
+            # (cheap substring check that skips parsing the final empty page)
+            if not html or 'data-film-id' not in html:
+                done = True
                 break
 
-            films = parse_films_list(html)
-            # filter new films by url
-            new = [f for f in films if f['slug'] not in seen_urls]
-            if not new:
+            new_count = 0
+            for f in parse_films_list(html):
+                if f['slug'] not in all_films:
+                    all_films[f['slug']] = f
+                    new_count += 1
+
+            if not new_count:
                 # no new films found -> conclude we're done
+                done = True
                 break
 
-            for f in new:
-                seen_urls.add(f['slug'])
-                all_films.append(f)
-
             page += 1
 
-        pages_scraped = page - 1
-        return all_films, pages_scraped
+    pages_scraped = page - 1
+    return list(all_films.values()), pages_scraped
 
 
-async def fetch_and_save_all(films, concurrency=6):
+def extract_film(film, html, stats_html, ratings_html):
+    '''Movie details for film from its page and its stats and ratings fragments'''
+    stats = extractors.extract_stats(stats_html)
+    ratings = extractors.extract_ratings(ratings_html)
+
+    details = parse_film_page(html) if html else {}
+    return {
+        **details,
+        'movie_id': film['id'],
+        'slug': film['slug'],
+        'total_views': stats[0],
+        'in_lists': stats[1],
+        'total_likes': stats[2],
+        'ratings': ratings,
+    }
+
+
+async def fetch_and_save_all(client, films, concurrency=6):
     sem = asyncio.Semaphore(concurrency)
     saved_movies = []
 
-    async with httpx.AsyncClient(headers={'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}, timeout=30.0) as client:
-        async def worker(film):
-            async with sem:
-                html = await fetch_html(client, f"{LETTERBOXD_BASE}/film/{film['slug']}")
-                stats_html = await fetch_html(client, f"{LETTERBOXD_BASE}/csi/film/{film['slug']}/stats/")
-                ratings_html = await fetch_html(client, f"{LETTERBOXD_BASE}/csi/film/{film['slug']}/ratings-summary/")
-
-                stats = extractors.extract_stats(stats_html)
-                ratings = extractors.extract_ratings(ratings_html)
-
-                details = parse_film_page(html) if html else {}
-                details = {
-                    **details,
-                    'movie_id': film['id'],
-                    'slug': film['slug'],
-                    'total_views': stats[0],
-                    'in_lists': stats[1],
-                    'total_likes': stats[2],
-                    'ratings': ratings,
-                }
-
-                await save_movie_from_data(details.copy())
-
-                saved_movies.append(details)
-
-        tasks = [asyncio.create_task(worker(f)) for f in films]
-        # process tasks in batches to avoid huge concurrency spikes
-        BATCH = 50
-        for i in range(0, len(tasks), BATCH):
-            batch = tasks[i : i + BATCH]
-            await asyncio.gather(*batch)
+    async def worker(film):
+        async with sem:
+            # the film page and its two CSI fragments are independent
+            html, stats_html, ratings_html = await asyncio.gather(
+                fetch_html(client, f"{LETTERBOXD_BASE}/film/{film['slug']}"),
+                fetch_html(client, f"{LETTERBOXD_BASE}/csi/film/{film['slug']}/stats/"),
+                fetch_html(client, f"{LETTERBOXD_BASE}/csi/film/{film['slug']}/ratings-summary/"),
+            )
+
+        # parsing is CPU work: free the fetch slot and keep it off the event loop
+        try:
+            return await asyncio.to_thread(extract_film, film, html, stats_html, ratings_html)
+        except Exception:
+            # a page the extractors cannot handle (e.g. an unreleased film) only loses that film
+            logger.exception('Could not extract film %s', film['slug'])
+            return None
+
+    tasks = [asyncio.create_task(worker(f)) for f in films]
+    try:
+        # sem caps in-flight requests; collect each film as soon as it is done
+        for fut in asyncio.as_completed(tasks):
+            movie = await fut
+            if movie is not None:
+                saved_movies.append(movie)
+    finally:
+        # if anything escaped a worker, do not leave the other fetches running
+        for task in tasks:
+            task.cancel()
+
+    await bulk_save_movies(saved_movies)
 
     return saved_movies
 
 
 @sync_to_async
-def get_movies_from_db_by_ids(movie_ids):
-    qs = Movie.objects.filter(movie_id__in=movie_ids)
-    return list(qs)
+def get_movies_from_db_by_ids(movie_ids, chunk_size=1000):
+    '''
+    Return slug, name, year and ratings dicts for the stored movies in
+    movie_ids. The IN clause is chunked to stay under SQLite's parameter limit.
+    '''
+    movies = []
+    for i in range(0, len(movie_ids), chunk_size):
+        qs = Movie.objects.filter(movie_id__in=movie_ids[i : i + chunk_size])
+        movies.extend(qs.values('slug', 'name', 'year', 'ratings'))
+    return movies
 
 
 async def recommender_view(request):
@@ -179,30 +338,26 @@ async def recommender_view(request):
         username = request.POST.get('username', '').strip()
         if not username:
             return HttpResponseBadRequest('username required')
+        if not is_valid_username(username):
+            return HttpResponseBadRequest('invalid username')
 
-        # Scrape the user's watched film list pages until exhausted
-        films, pages_scraped = await scrape_all_watched(username, concurrency=6)
+        # One pooled client serves the list pages and any per-film fetches
+        async with letterboxd_client() as client:
+            # Scrape the user's watched film list pages until exhausted
+            films, pages_scraped = await scrape_all_watched(client, username, concurrency=6)
 
-        # Fetch each film detail and save to DB
-        # saved_movies = await fetch_and_save_all(films, concurrency=6)
+            # Fetch each film detail and save to DB
+            # saved_movies = await fetch_and_save_all(client, films, concurrency=6)
 
         movie_ids = [f['id'] for f in films]
         recommendations = []
         recommender_error = None
 
         try:
-            # Query DB for the movies we just scraped
-            db_movies = await get_movies_from_db_by_ids(movie_ids)
-
-            # build letterboxd_data list of dicts: name, year, ratings
-            letterboxd_data = []
-            for m in db_movies:
-                name = getattr(m, 'name', None)
-                year = getattr(m, 'year', None)
-                ratings = getattr(m, 'ratings', None)
-                letterboxd_data.append({'slug': m.slug, 'name': name, 'year': year, 'ratings': ratings})
-
-            recommender = engine.MovieRecommender()
+            # Query DB for the movies we just scraped as dicts of slug, name, year, ratings
+            letterboxd_data = await get_movies_from_db_by_ids(movie_ids)
+
+            recommender = engine.get_recommender()
             recs_df = recommender.get_recommendations(letterboxd_data, n_recommendations=12, min_popularity=50)
 
             try:
@@ -1,5 +1,25 @@
+import json
 import re
-from bs4 import BeautifulSoup
+from lxml import etree, html as lxml_html
+
+NON_DIGITS_RE = re.compile(r'[^0-9]')
+
+# A stat count such as '987', '13k' or '1.5M', matched in one pass
+SHORTHAND_RE = re.compile(r'\s*([\d.]+)\s*([kmb]?)\s*', re.IGNORECASE)
+SHORTHAND_MULTIPLIERS = {'': 1, 'k': 1_000, 'm': 1_000_000, 'b': 1_000_000_000}
+
+# Spans inside the links of one statistic (e.g. '-watches') of the
+# production-statistic-list, compiled once and evaluated in libxml2
+STAT_SPANS_XPATH = etree.XPath(
+    "//div[contains(concat(' ', normalize-space(@class), ' '), ' production-statistic-list ')]"
+    "//div[contains(concat(' ', normalize-space(@class), ' '), concat(' ', $stat, ' '))]"
+    "//a//span"
+)
+
+# The average-rating link of the ratings CSI fragment
+DISPLAY_RATING_XPATH = etree.XPath(
+    "//a[contains(concat(' ', normalize-space(@class), ' '), ' display-rating ')]"
+)
 
 def extract_title(dom):
     '''Extract movie title from DOM.'''
@@ -21,16 +41,18 @@ def extract_numeric_text(text):
     Returns None if an error occurs.
     '''
     try:
-        numeric_value = int(re.sub(r'[^0-9]', '', text))
+        numeric_value = int(NON_DIGITS_RE.sub('', text))
         return numeric_value
     except ValueError:
         return None
 
 def extract_ratings(html):
     '''Extract movie rating from DOM.'''
-    soup = BeautifulSoup(html, 'html.parser')
-    ratings = soup.find('a', class_='display-rating')
-    return float(ratings.text) if ratings else None
+    # fetch_html returns None for a failed fetch
+    if not html or not html.strip():
+        return None
+    ratings = DISPLAY_RATING_XPATH(lxml_html.fromstring(html))
+    return float(ratings[0].text_content()) if ratings else None
 
 
 def shorthand_to_number(s):
@@ -38,24 +60,21 @@ def shorthand_to_number(s):
     Convert shorthand strings like '13k', '2M', '1.5B' into integers.
     Supports k (thousand), M (million), B (billion).
     '''
-    s = s.strip().lower()
-    multipliers = {
-        'k': 1_000,
-        'm': 1_000_000,
-        'b': 1_000_000_000
-    }
-
-    if s[-1] in multipliers:
-        return int(float(s[:-1]) * multipliers[s[-1]])
-    else:
-        return int(float(s))
+    match = SHORTHAND_RE.fullmatch(s)
+    if match is None:
+        raise ValueError(f'not a shorthand number: {s!r}')
+    number, suffix = match.groups()
+    return int(float(number) * SHORTHAND_MULTIPLIERS[suffix.lower()])
 
 def extract_stats(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    stats = soup.find('div', class_='production-statistic-list')
-    views = stats.find('div', class_='-watches').find('a').find('span').text
-    lists = stats.find('div', class_='-lists').find('a').find('span').text
-    likes = stats.find('div', class_='-likes').find('a').find('span').text
+    '''Extract (views, lists, likes) from the CSI stats fragment.'''
+    # fetch_html returns None for a failed fetch
+    if not html or not html.strip():
+        return (None, None, None)
+    doc = lxml_html.fromstring(html)
+    views = STAT_SPANS_XPATH(doc, stat='-watches')[0].text_content()
+    lists = STAT_SPANS_XPATH(doc, stat='-lists')[0].text_content()
+    likes = STAT_SPANS_XPATH(doc, stat='-likes')[0].text_content()
     return (shorthand_to_number(views), shorthand_to_number(lists), shorthand_to_number(likes))
 
 def extract_runtime(dom):
@@ -77,8 +96,6 @@ def extract_json_ld_script(dom):
         >>> script_data = extract_json_ld_script(dom)
         >>> movie_rating = script_data.get('aggregateRating', {}).get('ratingValue')
     '''
-    from json import loads as json_loads
-
     try:
         script_elem = dom.find('script', type='application/ld+json')
         if not script_elem or not script_elem.text:
@@ -87,14 +104,16 @@ def extract_json_ld_script(dom):
         script_text = script_elem.text.strip()
 
         # Handle comment format: /* ... */
-        if '/*' in script_text and '*/' in script_text:
-            try:
-                script_text = script_text.split('*/')[1].split('/*')[0]
-            except IndexError:
-                return None
-
-        return json_loads(script_text)
-    except (ValueError, IndexError, Exception):  # ValueError covers JSONDecodeError in older Python
+        # (keep the text between the first comment close and the next open)
+        comment_end = script_text.find('*/')
+        if comment_end != -1 and '/*' in script_text:
+            script_text = script_text[comment_end + 2:]
+            comment_start = script_text.find('/*')
+            if comment_start != -1:
+                script_text = script_text[:comment_start]
+
+        return json.loads(script_text)
+    except ValueError:  # JSONDecodeError
         return None
 
 def extract_poster(soup):
@@ -2,8 +2,34 @@
 
 import pandas as pd
 import numpy as np
-from collections import Counter, defaultdict
 import re
+from functools import cache
+
+# Compiled once for _normalize_name and the vectorized catalogue pass
+PUNCTUATION_RE = re.compile(r'[^\w\s]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Popularity score for a like count k: min(log10(k + 1) / 5, 1). It saturates
+# at 99,999 likes, so every count is a lookup in this table once clipped.
+POPULARITY_CAP = 99_999
+POPULARITY_SCORES = np.minimum(np.log10(np.arange(POPULARITY_CAP + 1) + 1.0) / 5.0, 1.0)
+
+
+def top_k_positions(scores, positions, k):
+    '''
+    The k entries of positions with the highest scores, best first. Same
+    result as DataFrame.nlargest(keep='first'), ties going to the earlier
+    position, but selected with a linear argpartition instead of a sort.
+    '''
+    if k <= 0:
+        return positions[:0]
+    if len(positions) > k:
+        values = scores[positions]
+        kth = values[np.argpartition(-values, k - 1)[k - 1]]
+        above = positions[values > kth]
+        tied = positions[values == kth][:k - len(above)]
+        positions = np.concatenate([above, tied])
+    return positions[np.lexsort((positions, -scores[positions]))]
 
 
 class MovieRecommender:
@@ -16,37 +42,68 @@ class MovieRecommender:
     COL_POPULARITY = 'total_likes'
     COL_POSTER = 'poster_url'
 
+    # Only these CSV columns are parsed; directors, views, lists etc. are never read
+    CSV_COLUMNS = {COL_SLUG, COL_NAME, COL_YEAR, COL_LENGTH, COL_RATING, COL_GENRES, COL_POPULARITY, COL_POSTER}
+
     def __init__(self, csv_path='utils/movies.csv'):
-        self.movies_df = pd.read_csv(csv_path, dtype={self.COL_NAME: str})
+        self.movies_df = pd.read_csv(
+            csv_path, usecols=lambda c: c in self.CSV_COLUMNS, dtype={self.COL_NAME: str}
+        )
         self._preprocess_data()
+        # PCG64 generator for the exploration draws in get_diverse_recommendations
+        self._rng = np.random.default_rng()
 
     def _normalize_name(self, name: str) -> str:
-        if pd.isna(name):
+        # names are nearly always str, so only fall back to pd.isna for anything else
+        if not isinstance(name, str) and pd.isna(name):
             return ''
         # collapse whitespace, remove punctuation, lowercase
-        s = re.sub(r'[^\w\s]', '', str(name).lower().strip())
-        s = re.sub(r'\s+', ' ', s)
+        s = PUNCTUATION_RE.sub('', str(name).lower().strip())
+        s = WHITESPACE_RE.sub(' ', s)
         return s
 
     def _split_genres(self, g):
         if pd.isna(g):
             return []
-        parts = [p.strip() for p in str(g).split(',')]
-        # filter out empties and normalize casing
-        parts = [p for p in parts if p]
-        return parts
+        # strip and drop empties in a single pass
+        return [p for p in (part.strip() for part in str(g).split(',')) if p]
 
     def _preprocess_data(self):
         for c in [self.COL_NAME, self.COL_GENRES]:
             if c not in self.movies_df.columns:
                 self.movies_df[c] = None
 
-        # Split genres into lists and set
-        self.movies_df['genre_list'] = self.movies_df[self.COL_GENRES].apply(self._split_genres)
-        self.movies_df['genre_set'] = self.movies_df['genre_list'].apply(set)
+        # Split genres into lists; the raw comma-separated column is not kept
+        self.movies_df['genre_list'] = self.movies_df.pop(self.COL_GENRES).apply(self._split_genres)
+
+        # Sparse movie x genre matrix in coordinate form: entry k says row
+        # _genre_rows[k] has genre _genre_vocab[_genre_cols[k]]. Scoring multiplies
+        # it with a per-genre vector via np.bincount, one pass over all movies.
+        # (a genre listed twice on one movie counts once)
+        memberships = self.movies_df['genre_list'].explode().dropna()
+        rows = self.movies_df.index.get_indexer(memberships.index)
+        cols, self._genre_vocab = pd.factorize(memberships)
+        unique = ~pd.Series(rows * len(self._genre_vocab) + cols).duplicated().to_numpy()
+        self._genre_rows, self._genre_cols = rows[unique], cols[unique]
+        self._genre_counts = np.bincount(self._genre_rows, minlength=len(self.movies_df))
 
         # Normalize names for matching
-        self.movies_df['name_normalized'] = self.movies_df[self.COL_NAME].apply(self._normalize_name)
+        # (same steps as _normalize_name, run as whole-column string operations)
+        self.movies_df['name_normalized'] = (
+            self.movies_df[self.COL_NAME].fillna('').astype(str)
+            .str.lower().str.strip()
+            .str.replace(PUNCTUATION_RE, '', regex=True)
+            .str.replace(WHITESPACE_RE, ' ', regex=True)
+        )
+        # normalized name -> row positions in file order, so matching is a dict lookup
+        self._name_index = self.movies_df.groupby('name_normalized', sort=False).indices
+        # the same positions keyed without spaces, for titles that only differ in
+        # where punctuation left a gap ('wall-e' -> 'walle' vs 'wall e')
+        self._compact_name_index = self.movies_df.groupby(
+            self.movies_df['name_normalized'].str.replace(' ', '', regex=False), sort=False
+        ).indices
+        # only ever compared for equality (the watched filter), which category codes make cheaper
+        self.movies_df['name_normalized'] = self.movies_df['name_normalized'].astype('category')
 
         # Fill numeric columns with sensible defaults
         for col in [self.COL_RATING, self.COL_YEAR, self.COL_LENGTH, self.COL_POPULARITY]:
@@ -59,6 +116,12 @@ class MovieRecommender:
         self.movies_df[self.COL_LENGTH] = pd.to_numeric(self.movies_df[self.COL_LENGTH], errors='coerce')
         self.movies_df[self.COL_POPULARITY] = pd.to_numeric(self.movies_df[self.COL_POPULARITY], errors='coerce').fillna(0)
 
+        # The rating (20%) and popularity (10%) parts of a score do not depend on
+        # the user, so they are computed once here instead of on every request
+        self._rating_scores = (self.movies_df[self.COL_RATING].to_numpy() / 5.0) * 0.20
+        likes = np.clip(self.movies_df[self.COL_POPULARITY].to_numpy(), 0, POPULARITY_CAP).astype(np.intp)
+        self._popularity_scores = POPULARITY_SCORES[likes] * 0.10  # scale so 100k likes ~ 1.0
+
         # Fill missing genre_list with empty lists (already handled) and fill missing strings
         self.movies_df[self.COL_NAME] = self.movies_df[self.COL_NAME].fillna('')
         self.movies_df[self.COL_POSTER] = self.movies_df.get(self.COL_POSTER, '').fillna('')
@@ -68,31 +131,36 @@ class MovieRecommender:
         letterboxd_data: list of dicts: {'name':..., 'year':..., 'ratings': ...}
         returns DataFrame of matched movies with letterboxd ratings saved in column 'user_rating'
         '''
-        matched = []
+        positions = []
+        user_ratings = []
+        years = self.movies_df[self.COL_YEAR].to_numpy()
         for entry in letterboxd_data:
             name = entry.get('name', '')
             year = entry.get('year')
             user_rating = entry.get('ratings', np.nan)  # Letterboxd uses 0.5-5.0
 
-            norm = self._normalize_name(name)
-            matches = self.movies_df[self.movies_df['name_normalized'] == norm]
+            normalized = self._normalize_name(name)
+            matches = self._name_index.get(normalized)
+            if matches is None:
+                # fall back to ignoring spacing before giving up on the entry
+                matches = self._compact_name_index.get(normalized.replace(' ', ''))
+            if matches is None:
+                continue
 
             # if multiple, try year
             if len(matches) > 1 and year:
-                year_matches = matches[matches[self.COL_YEAR] == year]
+                year_matches = matches[years[matches] == year]
                 if len(year_matches) > 0:
                     matches = year_matches
 
-            if len(matches) > 0:
-                # copy series and attach user's rating
-                row = matches.iloc[0].copy()
-                row['user_rating'] = float(user_rating) if not pd.isna(user_rating) else np.nan
-                matched.append(row)
+            positions.append(matches[0])
+            user_ratings.append(float(user_rating) if not pd.isna(user_rating) else np.nan)
 
-        if not matched:
+        if not positions:
             return pd.DataFrame(columns=list(self.movies_df.columns) + ['user_rating'])
 
-        return pd.DataFrame(matched)
+        # one row per matched entry with the user's rating attached
+        return self.movies_df.iloc[positions].assign(user_rating=user_ratings)
 
     def analyze_user_preferences(self, user_movies_df):
         '''
@@ -102,8 +170,6 @@ class MovieRecommender:
           - top genres among high-rated movies
         '''
         prefs = {}
-        genre_scores = defaultdict(float)
-        genre_counts = defaultdict(int)
 
         # If user didn't give explicit user_rating, fallback to movie's rating
         if 'user_rating' not in user_movies_df.columns:
@@ -111,20 +177,17 @@ class MovieRecommender:
 
         user_movies_df['user_rating'] = pd.to_numeric(user_movies_df['user_rating'], errors='coerce').fillna(0)
 
-        for _, r in user_movies_df.iterrows():
-            u_r = float(r.get('user_rating', 0) or 0)
-            genres = r.get('genre_list') or []
-            for g in genres:
-                genre_scores[g] += u_r
-                genre_counts[g] += 1
-
-        # Average rating per genre
-        genre_preferences = {}
-        for g in genre_scores:
-            genre_preferences[g] = genre_scores[g] / max(genre_counts[g], 1)
+        # one row per (movie, genre) carrying the user's rating for that movie
+        genre_ratings = (
+            user_movies_df[['genre_list', 'user_rating']]
+            .explode('genre_list')
+            .dropna(subset=['genre_list'])
+        )
+        by_genre = genre_ratings.groupby('genre_list', sort=False)['user_rating']
 
-        # Sort genres by preference
-        prefs['genres'] = dict(sorted(genre_preferences.items(), key=lambda kv: kv[1], reverse=True))
+        # Average rating per genre, sorted by preference (ties keep first-seen order)
+        genre_preferences = (by_genre.sum() / by_genre.count()).sort_values(ascending=False, kind='stable')
+        prefs['genres'] = genre_preferences.to_dict()
 
         # overall user stats
         prefs['avg_ratings'] = float(user_movies_df['user_rating'].mean()) if len(user_movies_df) > 0 else 0.0
@@ -137,75 +200,76 @@ class MovieRecommender:
         prefs['runtime_std'] = float(user_movies_df[self.COL_LENGTH].std(ddof=0)) if len(user_movies_df) > 1 else 0.0
 
         # Top genres among movies the user really liked (>=4.0 on 0-5 scale)
-        high_rated = user_movies_df[user_movies_df['user_rating'] >= 4.0]
-        if len(high_rated) > 0:
-            all_genres = [g for genres in high_rated['genre_list'] for g in genres]
-            prefs['high_rated_genres'] = [g for g, _ in Counter(all_genres).most_common(5)]
-        else:
-            prefs['high_rated_genres'] = []
+        # (codes in first-seen order, so equal counts keep the genre seen first)
+        high_rated = genre_ratings['genre_list'].to_numpy()[genre_ratings['user_rating'].to_numpy() >= 4.0]
+        codes, genres = pd.factorize(high_rated)
+        counts = np.bincount(codes, minlength=len(genres))
+        prefs['high_rated_genres'] = genres[top_k_positions(counts, np.arange(len(genres)), 5)].tolist()
 
         return prefs
 
-    def calculate_similarity_score(self, movie_row, prefs, watched_normalized_names):
+    def _genre_vector(self, values):
+        '''Dense vector over _genre_vocab from a {genre: value} dict; unknown genres are ignored'''
+        vec = np.zeros(len(self._genre_vocab))
+        cols = self._genre_vocab.get_indexer(list(values))
+        known = cols >= 0
+        vec[cols[known]] = np.fromiter(values.values(), dtype=float, count=len(values))[known]
+        return vec
+
+    def _genre_matvec(self, genre_vector):
+        '''Per-movie sum of genre_vector over the movie's genres (sparse matrix-vector product)'''
+        return np.bincount(
+            self._genre_rows, weights=genre_vector[self._genre_cols], minlength=len(self.movies_df)
+        )
+
+    def calculate_similarity_scores(self, positions, prefs):
         '''
-        movie_row: pandas Series representing a candidate movie
+        positions: row positions in movies_df of the candidate movies, already watched ones removed
         prefs: preferences dict from analyze_user_preferences
-        watched_normalized_names: set of normalized movie names the user has already watched
-        returns float score, higher is better. If already watched returns -1
+        returns numpy array of scores aligned with positions, higher is better
         '''
-
-        name_norm = self._normalize_name(movie_row.get(self.COL_NAME, ''))
-        if name_norm in watched_normalized_names:
-            return -1.0
-
-        score = 0.0
+        score = np.zeros(len(positions))
 
         # Genre matching (40%)
-        movie_genres = set(movie_row.get('genre_list') or [])
-        if len(movie_genres) > 0 and prefs['genres']:
+        if prefs['genres']:
             # average of user's avg ratings for matched genres (on 0-5 scale)
-            matched_scores = [prefs['genres'].get(g, 0) for g in movie_genres]
-            if matched_scores:
-                genre_component = (sum(matched_scores) / len(matched_scores)) / 5.0  # normalize to 0-1
-                score += genre_component * 0.40
+            genre_pref = self._genre_vector(prefs['genres'])
+            genre_sums = self._genre_matvec(genre_pref)[positions]
+            genre_counts = self._genre_counts[positions]
+            genre_avg = np.divide(genre_sums, genre_counts, out=np.zeros(len(positions)), where=genre_counts > 0)
+            score += (genre_avg / 5.0) * 0.40  # normalize to 0-1
 
         # High-rated genre bonus (10%)
         if prefs.get('high_rated_genres'):
-            high_matches = len(movie_genres.intersection(set(prefs['high_rated_genres'])))
-            high_ratio = high_matches / max(len(prefs['high_rated_genres']), 1)
-            score += high_ratio * 0.10
+            high = self._genre_vector(dict.fromkeys(prefs['high_rated_genres'], 1.0))
+            high_matches = self._genre_matvec(high)[positions]
+            score += (high_matches / max(len(prefs['high_rated_genres']), 1)) * 0.10
 
         # Movie's own average rating (20%) - ratings column is 0-5, normalize to 0-1
-        movie_rating = float(movie_row.get(self.COL_RATING) or 0.0)
-        score += (movie_rating / 5.0) * 0.20
+        # (an unrated movie keeps a NaN score and is dropped by the caller's > 0 filter)
+        score += self._rating_scores[positions]
 
         # Popularity (10%) - using total_likes / total_views or fallback; log-scaled
-        pop = float(movie_row.get(self.COL_POPULARITY) or 0.0)
-        if pop > 0:
-            pop_score = min(np.log10(pop + 1) / 5.0, 1.0)  # scale so 100k likes ~ 1.0
-            score += pop_score * 0.10
+        score += self._popularity_scores[positions]
 
         # Year proximity (10%)
+        # (np.fmax clips at 0 and also turns a missing year's NaN into 0)
         avg_year = prefs.get('avg_year')
         year_std = prefs.get('year_std', 0.0) or 0.0
-        movie_year = movie_row.get(self.COL_YEAR)
-        if not pd.isna(avg_year) and not pd.isna(movie_year):
+        if not pd.isna(avg_year):
             denom = (year_std * 2.0) + 1.0
-            year_diff = abs(float(movie_year) - float(avg_year))
-            year_score = max(0.0, 1.0 - (year_diff / denom))
-            score += year_score * 0.10
+            year_diff = np.abs(self.movies_df[self.COL_YEAR].to_numpy()[positions] - float(avg_year))
+            score += np.fmax(1.0 - (year_diff / denom), 0.0) * 0.10
 
         # Runtime proximity (10%)
         avg_runtime = prefs.get('avg_runtime')
         runtime_std = prefs.get('runtime_std', 0.0) or 0.0
-        movie_runtime = movie_row.get(self.COL_LENGTH)
-        if not pd.isna(avg_runtime) and not pd.isna(movie_runtime):
+        if not pd.isna(avg_runtime):
             denom_rt = (runtime_std * 2.0) + 10.0  # add 10 min tolerance baseline
-            runtime_diff = abs(float(movie_runtime) - float(avg_runtime))
-            runtime_score = max(0.0, 1.0 - (runtime_diff / denom_rt))
-            score += runtime_score * 0.10
+            runtime_diff = np.abs(self.movies_df[self.COL_LENGTH].to_numpy()[positions] - float(avg_runtime))
+            score += np.fmax(1.0 - (runtime_diff / denom_rt), 0.0) * 0.10
 
-        return float(score)
+        return score
 
     def get_recommendations(self, letterboxd_data, n_recommendations=20, min_popularity=1000):
         '''
@@ -218,34 +282,31 @@ class MovieRecommender:
 
         prefs = self.analyze_user_preferences(user_movies)
 
-        # set of normalized watched names to exclude
-        watched_norm = set(user_movies['name_normalized'].values)
-
         # Candidates: require at least min_popularity (total_likes / total_views)
-        candidates = self.movies_df[self.movies_df[self.COL_POPULARITY] >= min_popularity].copy()
+        # and leave out everything the user has already watched before scoring
+        # (kept as row positions; only the final top rows become a DataFrame)
+        popular = self.movies_df[self.COL_POPULARITY].to_numpy() >= min_popularity
+        watched = self.movies_df['name_normalized'].isin(set(user_movies['name_normalized'])).to_numpy()
+        candidates = np.flatnonzero(popular & ~watched)
 
-        # compute score column
-        candidates['recommendation_score'] = candidates.apply(
-            lambda row: self.calculate_similarity_score(row, prefs, watched_norm), axis=1
-        )
-
-        # filter out negative scores (already watched or poor match)
-        candidates = candidates[candidates['recommendation_score'] > 0].copy()
+        # compute scores; NaN (unrated) and zero ones never qualify
+        scores = self.calculate_similarity_scores(candidates, prefs)
+        qualified = np.flatnonzero(scores > 0)
 
-        if candidates.empty:
+        if qualified.size == 0:
             return pd.DataFrame(columns=[
                 self.COL_NAME, self.COL_YEAR, 'genre_list', self.COL_LENGTH,
                 self.COL_RATING, self.COL_POPULARITY, self.COL_POSTER, 'recommendation_score'
             ])
 
         # select top
-        top = candidates.nlargest(n_recommendations, 'recommendation_score')
+        top = top_k_positions(scores, qualified, n_recommendations)
 
         # keep friendly output columns
-        out = top[[
+        out = self.movies_df.iloc[candidates[top]][[
             self.COL_SLUG, self.COL_NAME, self.COL_YEAR, 'genre_list', self.COL_LENGTH,
-            self.COL_RATING, self.COL_POPULARITY, self.COL_POSTER, 'recommendation_score'
-        ]].reset_index(drop=True)
+            self.COL_RATING, self.COL_POPULARITY, self.COL_POSTER,
+        ]].assign(recommendation_score=scores[top]).reset_index(drop=True)
 
         return out
 
@@ -269,20 +330,31 @@ class MovieRecommender:
             return safe.head(n_recommendations)
 
         # weighting by sqrt(score) for exploration
-        scores = rest['recommendation_score'].clip(lower=0).astype(float)
-        weights = (scores ** 0.5)
+        weights = np.sqrt(rest['recommendation_score'].to_numpy(dtype=float).clip(min=0))
         weights_sum = weights.sum()
+        size = min(n_explore, len(rest))
         if weights_sum <= 0:
-            chosen = rest.sample(n=min(n_explore, len(rest)), replace=False)
+            chosen = rest.sample(n=size, replace=False, random_state=self._rng)
         else:
-            probs = weights / weights_sum
-            chosen_idx = np.random.choice(rest.index, size=min(n_explore, len(rest)), replace=False, p=probs)
-            chosen = rest.loc[chosen_idx]
+            # Gumbel-top-k: the size largest log(weight) + Gumbel noise keys are a
+            # weighted draw without replacement, in draw order, in one linear pass
+            with np.errstate(divide='ignore'):
+                keys = np.log(weights) + self._rng.gumbel(size=len(weights))
+            chosen = rest.iloc[top_k_positions(keys, np.arange(len(rest)), size)]
 
         result = pd.concat([safe, chosen], ignore_index=True).head(n_recommendations)
         return result.reset_index(drop=True)
 
 
+@cache
+def get_recommender(csv_path='utils/movies.csv'):
+    '''
+    Shared MovieRecommender for csv_path, loaded and preprocessed once per
+    process. Recommending never modifies movies_df, so callers can share it.
+    '''
+    return MovieRecommender(csv_path)
+
+
 if __name__ == '__main__':
     recommender = MovieRecommender('movies.csv')
 